@@ -1,16 +1,25 @@
 
 import os
+import re
 import json
+import orjson
 import subprocess
 import time
+import threading
 import requests  
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Any, List, Optional
-import uuid
+from typing import Dict, Any, List, Optional, Tuple
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional
 import anthropic
 
+from log_writer import BackgroundLogWriter
+
 # ============== CONFIGURACIÓN ==============
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 ANTHROPIC_MODEL = os.environ.get("ANTHROPIC_MODEL", "claude-opus-4-1-20250805")
@@ -26,23 +35,56 @@ LOG_FILE = BASE_DIR / "chat_log.jsonl"
 MCP_SESSION_ID: Optional[str] = None  #
 REMOTE_TIMEOUT = 15   
 WIRE_LOG = BASE_DIR / "wire_log.ndjson"
+# Si es 1, el wire log guarda también los cuerpos de respuesta (modo depuración)
+WIRE_LOG_BODIES = os.environ.get("MCP_WIRE_LOG_BODIES", "0") == "1"
+
+# Sesión HTTP compartida: reutiliza la conexión TLS con Cloud Run entre llamadas
+# y reintenta 429/503 con backoff exponencial.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    # Sólo se reintentan respuestas 429/503: un timeout o error de conexión
+    # en un POST no se repite (tools/call no es idempotente)
+    max_retries=Retry(
+        total=2,
+        connect=False,
+        read=False,
+        other=0,
+        status=2,
+        backoff_factor=0.3,
+        status_forcelist=[429, 503],
+        allowed_methods=frozenset({"GET", "POST"}),
+        raise_on_status=False,
+    ),
+))
+_SESSION.headers.update({
+    "Content-Type": "application/json",
+    "Accept": "application/json, text/event-stream"
+})
+
+_loads = orjson.loads
+
+# Los logs se escriben en segundo plano, fuera del camino de cada petición
+_WIRE_WRITER = BackgroundLogWriter(WIRE_LOG)
+_CHAT_WRITER = BackgroundLogWriter(LOG_FILE)
 
 def _wire_log(event: str, data: Dict[str, Any]):
     try:
-        with open(WIRE_LOG, "a", encoding="utf-8") as f:
-            f.write(json.dumps({
-                "ts": datetime.now().isoformat(),
-                "event": event,
-                **data
-            }, ensure_ascii=False) + "\n")
+        _WIRE_WRITER.write(orjson.dumps({
+            "ts": datetime.now().isoformat(),
+            "event": event,
+            **data
+        }, option=orjson.OPT_NON_STR_KEYS) + b"\n")
     except Exception:
         pass
 
+# Los ids JSON-RPC sólo deben ser únicos dentro de la sesión: basta un contador
+_ID_COUNTER = itertools.count(1)
+
 def _remote_headers(extra: Dict[str, str] = None) -> Dict[str, str]:
-    h = {
-        "Content-Type": "application/json",
-        "Accept": "application/json, text/event-stream"  
-    }
+    # Content-Type/Accept ya van en _SESSION.headers
+    h = {}
     global MCP_SESSION_ID
     if MCP_SESSION_ID:
         h["Mcp-Session-Id"] = MCP_SESSION_ID
@@ -54,49 +96,56 @@ def _remote_headers(extra: Dict[str, str] = None) -> Dict[str, str]:
 def mcp_request(method: str, params: Dict[str, Any]) -> requests.Response:
     payload = {
         "jsonrpc": "2.0",
-        "id": str(uuid.uuid4()),
+        "id": next(_ID_COUNTER),
         "method": method,
         "params": params
     }
 
+    # Se serializa una sola vez: el mismo buffer va al POST y al wire log
+    body_bytes = orjson.dumps(payload)
+
     _wire_log("jsonrpc.request", {
         "url": f"{REMOTE_SERVER_URL}/mcp",
-        "headers": _remote_headers(),           
-        "body": payload
+        "headers": {**_SESSION.headers, **_remote_headers()},
+        "body": orjson.Fragment(body_bytes)
     })
 
-    resp = requests.post(
+    resp = _SESSION.post(
         f"{REMOTE_SERVER_URL}/mcp",
-        json=payload,
+        data=body_bytes,
         headers=_remote_headers(),
-        timeout=REMOTE_TIMEOUT
+        timeout=REMOTE_TIMEOUT,
+        stream=True
     )
 
     try:
         ct = (resp.headers.get("Content-Type") or "")
-        body_text = resp.text
         base = {
             "status": resp.status_code,
             "ct": ct,
             "headers": dict(resp.headers),
         }
 
-        if "text/event-stream" in ct.lower():
+        if not WIRE_LOG_BODIES:
+            # El cuerpo queda sin leer: _parse_mcp_response lo consume en streaming
+            _wire_log("jsonrpc.response", base)
+        elif "text/event-stream" in ct.lower():
+            body_text = resp.text
             chunks = []
             for ln in body_text.splitlines():
                 if ln.startswith("data:"):
                     payload_line = ln[len("data:"):].strip()
                     if payload_line and payload_line != "[DONE]":
                         try:
-                            chunks.append(json.loads(payload_line))
+                            chunks.append(_loads(payload_line))
                         except Exception:
                             chunks.append({"raw": payload_line})
             _wire_log("jsonrpc.response.stream", {**base, "chunks": chunks})
         else:
             try:
-                _wire_log("jsonrpc.response", {**base, "body_json": resp.json()})
+                _wire_log("jsonrpc.response", {**base, "body_json": _loads(resp.content)})
             except Exception:
-                _wire_log("jsonrpc.response", {**base, "body_text": body_text[:20000]})
+                _wire_log("jsonrpc.response", {**base, "body_text": resp.text[:20000]})
     except Exception as e:
         _wire_log("jsonrpc.response.error", {"error": str(e)})
 
@@ -107,30 +156,31 @@ def _parse_mcp_response(resp: requests.Response) -> Dict[str, Any]:
 
     if "application/json" in ct:
         try:
-            return {"ok": True, "data": resp.json()}
+            return {"ok": True, "data": _loads(resp.content)}
         except Exception as e:
             return {"ok": False, "error": f"No JSON válido: {e}. Body={resp.text[:200]}"}
 
     if "text/event-stream" in ct:
         try:
-            lines = resp.text.splitlines()
-            json_candidates = []
-            for ln in lines:
-                if ln.startswith("data:"):
-                    payload = ln[len("data:"):].strip()
-                    if payload and payload != "[DONE]":
-                        json_candidates.append(payload)
-
-            # toma el último JSON válido
-            for s in reversed(json_candidates):
-                try:
-                    return {"ok": True, "data": json.loads(s)}
-                except Exception:
+            # Sólo interesa el último evento "data:"; se guarda uno a la vez
+            # y se corta al ver [DONE]
+            last = None
+            for ln in resp.iter_lines():
+                if not ln.startswith(b"data:"):
                     continue
+                payload = ln[len(b"data:"):].strip()
+                if payload == b"[DONE]":
+                    break
+                if payload:
+                    last = payload
 
-            return {"ok": False, "error": f"No encontré JSON en SSE. Body={resp.text[:200]}"}
+            if last is not None:
+                return {"ok": True, "data": _loads(last)}
+            return {"ok": False, "error": "No encontré JSON en SSE"}
         except Exception as e:
             return {"ok": False, "error": f"Error parseando SSE: {e}"}
+        finally:
+            resp.close()
 
     body_snip = resp.text[:200] if resp.text else "<vacío>"
     return {"ok": False, "error": f"Content-Type inesperado '{ct}'. Body={body_snip}"}
@@ -160,6 +210,8 @@ def mcp_tools_list() -> List[str]:
     try:
         resp = mcp_request("tools/list", {})
         if resp.status_code != 200:
+            # stream=True: cerrar para devolver la conexión al pool
+            resp.close()
             return []
         parsed = _parse_mcp_response(resp)
         if not parsed["ok"]:
@@ -171,20 +223,30 @@ def mcp_tools_list() -> List[str]:
         return []
 
 # ============== FUNCIONES SERVIDOR REMOTO ==============
+def _tool_result(data: Dict[str, Any]) -> Dict[str, Any]:
+    if "error" in data:
+        return {"error": str(data["error"])}
+    result = data.get("result", {})
+    # FastMCP suele devolver {"content":[{"type":"text","text":"..."}]}
+    if isinstance(result, dict) and "content" in result:
+        content = result["content"]
+        if isinstance(content, list) and content and isinstance(content[0], dict):
+            if "text" in content[0]:
+                return {"result": content[0]["text"]}
+        return {"result": content}
+
+    # Texto plano u otro valor: se devuelve tal cual; process_tool_calls se
+    # encarga de formatearlo
+    return {"result": result}
+
 def call_remote_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     try:
+        # Los 429/503 los reintenta el HTTPAdapter de _SESSION
         resp = mcp_request("tools/call", {
             "name": tool_name,
             "arguments": arguments
         })
 
-        if resp.status_code in (429, 503):
-            time.sleep(1.5)
-            resp = mcp_request("tools/call", {
-                "name": tool_name,
-                "arguments": arguments
-            })
-
         if resp.status_code != 200:
             return {"error": f"HTTP {resp.status_code}: {resp.text[:300]}"}
 
@@ -192,25 +254,7 @@ def call_remote_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any
         if not parsed["ok"]:
             return {"error": parsed["error"]}
 
-        data = parsed["data"]
-        if "error" in data:
-            return {"error": str(data["error"])}
-        result = data.get("result", {})
-
-
-        result = data.get("result", {})
-        # FastMCP suele devolver {"content":[{"type":"text","text":"..."}]}
-        if isinstance(result, dict) and "content" in result:
-            content = result["content"]
-            if isinstance(content, list) and content and isinstance(content[0], dict):
-                if "text" in content[0]:
-                    return {"result": content[0]["text"]}
-            return {"result": str(content)}
-        # Si ya es texto plano
-        if isinstance(result, str):
-            return {"result": result}
-
-        return {"result": json.dumps(result, ensure_ascii=False)}
+        return _tool_result(parsed["data"])
 
     except requests.exceptions.Timeout:
         return {"error": "Timeout al conectar con el servidor remoto"}
@@ -229,9 +273,9 @@ def call_remote_demorse(code: str) -> Dict[str, Any]:
 
 def test_remote_server() -> bool:
     try:
-        resp = requests.get(f"{REMOTE_SERVER_URL}/", timeout=8)
+        resp = _SESSION.get(f"{REMOTE_SERVER_URL}/", timeout=8)
         if resp.status_code == 200:
-            data = resp.json()
+            data = _loads(resp.content)
             print(f"✅ Servidor remoto conectado: {data.get('kind','?')}  (mount {data.get('mount')})")
             print(f"   Herramientas (health): {', '.join(data.get('tools', []))}")
             return True
@@ -244,6 +288,13 @@ def test_remote_server() -> bool:
 
 
 # ============== FUNCIONES DNS (locales) ==============
+# Caché LRU con expiración para resultados de tools DNS: repetir el análisis
+# del mismo dominio entre turnos no vuelve a salir a la red.
+DNS_CACHE_TTL = 60.0
+DNS_CACHE_MAX = 256
+_DNS_CACHE: "OrderedDict[Any, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_DNS_CACHE_LOCK = threading.Lock()
+
 def call_dns_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     try:
         import sys
@@ -259,7 +310,27 @@ def call_dns_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         }
         
         if tool_name in tools:
+            try:
+                key = (tool_name, frozenset(arguments.items()))
+            except TypeError:
+                key = None  # argumentos no hasheables: sin caché
+
+            now = time.monotonic()
+            if key is not None and tool_name != "ping":
+                with _DNS_CACHE_LOCK:
+                    hit = _DNS_CACHE.get(key)
+                    if hit and hit[0] > now:
+                        _DNS_CACHE.move_to_end(key)
+                        return hit[1]
+
             result = tools[tool_name](**arguments)
+
+            if key is not None and tool_name != "ping" and not (isinstance(result, dict) and "error" in result):
+                with _DNS_CACHE_LOCK:
+                    _DNS_CACHE[key] = (now + DNS_CACHE_TTL, result)
+                    _DNS_CACHE.move_to_end(key)
+                    while len(_DNS_CACHE) > DNS_CACHE_MAX:
+                        _DNS_CACHE.popitem(last=False)
             return result
         else:
             return {"error": f"Herramienta {tool_name} no encontrada"}
@@ -274,13 +345,16 @@ def list_files(path: str = ".") -> Dict[str, Any]:
         if not target_path.exists():
             return {"error": f"La ruta {path} no existe"}
         
+        # DirEntry cachea el tipo del dirent: sin stat() extra por elemento
         items = []
-        for item in target_path.iterdir():
-            items.append({
-                "name": item.name,
-                "type": "directory" if item.is_dir() else "file",
-                "size": item.stat().st_size if item.is_file() else None
-            })
+        with os.scandir(target_path) as it:
+            for entry in it:
+                is_file = entry.is_file()
+                items.append({
+                    "name": entry.name,
+                    "type": "directory" if entry.is_dir() else "file",
+                    "size": entry.stat().st_size if is_file else None
+                })
         
         return {"path": str(path), "items": items, "total": len(items)}
     except Exception as e:
@@ -292,11 +366,12 @@ def read_file(path: str) -> Dict[str, Any]:
         if not file_path.exists():
             return {"error": f"El archivo {path} no existe"}
         
-        content = file_path.read_text(encoding='utf-8')
+        # Se cuentan los saltos sobre los bytes y se decodifica una sola vez
+        data = file_path.read_bytes()
         return {
             "path": str(path),
-            "content": content,
-            "lines": content.count('\n') + 1
+            "content": data.decode('utf-8'),
+            "lines": data.count(b'\n') + 1
         }
     except Exception as e:
         return {"error": str(e)}
@@ -324,6 +399,9 @@ def create_directory(path: str) -> Dict[str, Any]:
         return {"error": str(e)}
 
 # ============== FUNCIONES GIT ==============
+# Sin locks opcionales: status/log no reescriben el índice
+_GIT_ENV = {**os.environ, "GIT_OPTIONAL_LOCKS": "0"}
+
 def run_git_command(args: List[str]) -> Dict[str, Any]:
     try:
         result = subprocess.run(
@@ -331,7 +409,8 @@ def run_git_command(args: List[str]) -> Dict[str, Any]:
             cwd=WORKSPACE_DIR,
             capture_output=True,
             text=True,
-            check=False
+            check=False,
+            env=_GIT_ENV
         )
         return {
             "success": result.returncode == 0,
@@ -344,10 +423,17 @@ def run_git_command(args: List[str]) -> Dict[str, Any]:
         return {"success": False, "error": str(e)}
 
 def git_init() -> Dict[str, Any]:
-    result = run_git_command(["init"])
+    result = run_git_command(["init", "-b", "main"])
     if result["success"]:
-        run_git_command(["config", "user.name", "MCP User"])
-        run_git_command(["config", "user.email", "mcp@example.com"])
+        # Usuario por defecto escrito directo en .git/config (sin más forks)
+        config = WORKSPACE_DIR / ".git" / "config"
+        try:
+            if "[user]" not in config.read_text(encoding="utf-8"):
+                with open(config, "a", encoding="utf-8") as f:
+                    f.write("[user]\n\tname = MCP User\n\temail = mcp@example.com\n")
+        except OSError:
+            run_git_command(["config", "user.name", "MCP User"])
+            run_git_command(["config", "user.email", "mcp@example.com"])
     return result
 
 def git_status() -> Dict[str, Any]:
@@ -373,6 +459,62 @@ class SimpleChatbot:
         self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
         self.conversation_history = []
         self.remote_available = False
+        self._system_prompt: Optional[str] = None
+
+        # Todos los tags en una sola expresión con grupos nombrados: un único
+        # escaneo por respuesta. m.lastgroup indica qué herramienta coincidió.
+        tool_patterns = [
+            # DNS Local
+            ("dns_ping", r'\[DNS:\s*ping\]'),
+            ("dns_salud", r'\[DNS:\s*salud_dns\s+(?P<dns_salud_d>\S+)\]'),
+            ("dns_correo", r'\[DNS:\s*correo_politicas\s+(?P<dns_correo_d>\S+)\]'),
+            ("dns_dnssec", r'\[DNS:\s*estado_dnssec\s+(?P<dns_dnssec_d>\S+)\]'),
+            ("dns_propagacion", r'\[DNS:\s*propagacion\s+(?P<dns_propagacion_d>\S+)\]'),
+
+            # Archivos
+            ("file_list", r'\[FILE:\s*list\]'),
+            ("file_read", r'\[FILE:\s*read\s+(?P<file_read_p>\S+)\]'),
+            ("file_write", r'\[FILE:\s*write\s+(?P<file_write_p>\S+)\s+"(?P<file_write_c>[^"]+)"\]'),
+            ("file_mkdir", r'\[FILE:\s*mkdir\s+(?P<file_mkdir_p>\S+)\]'),
+
+            # Git
+            ("git_init", r'\[GIT:\s*init\]'),
+            ("git_status", r'\[GIT:\s*status\]'),
+            ("git_add", r'\[GIT:\s*add\]'),
+            ("git_commit", r'\[GIT:\s*commit\s+"(?P<git_commit_m>[^"]+)"\]'),
+            ("git_log", r'\[GIT:\s*log\]'),
+
+            # Servidor Remoto
+            ("remote_echo", r'\[REMOTE:\s*echo\s+"(?P<remote_echo_t>[^"]+)"\]'),
+            ("remote_morse", r'\[REMOTE:\s*morse\s+"(?P<remote_morse_t>[^"]+)"\]'),
+            ("remote_demorse", r'\[REMOTE:\s*demorse\s+"(?P<remote_demorse_c>[^"]+)"\]'),
+        ]
+        self._tool_re = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in tool_patterns))
+
+        # nombre -> (tipo, función). Los "remote" devuelven (tool, argumentos)
+        # para call_remote_tool.
+        self._tool_dispatch = {
+            "dns_ping": ("dns", lambda m: call_dns_tool("ping", {})),
+            "dns_salud": ("dns", lambda m: call_dns_tool("salud_dns", {"dominio": m.group("dns_salud_d")})),
+            "dns_correo": ("dns", lambda m: call_dns_tool("correo_politicas", {"dominio": m.group("dns_correo_d")})),
+            "dns_dnssec": ("dns", lambda m: call_dns_tool("estado_dnssec", {"dominio": m.group("dns_dnssec_d")})),
+            "dns_propagacion": ("dns", lambda m: call_dns_tool("propagacion", {"dominio": m.group("dns_propagacion_d")})),
+
+            "file_list": ("local", lambda m: list_files()),
+            "file_read": ("local", lambda m: read_file(m.group("file_read_p"))),
+            "file_write": ("local", lambda m: write_file(m.group("file_write_p"), m.group("file_write_c"))),
+            "file_mkdir": ("local", lambda m: create_directory(m.group("file_mkdir_p"))),
+
+            "git_init": ("local", lambda m: git_init()),
+            "git_status": ("local", lambda m: git_status()),
+            "git_add": ("local", lambda m: git_add()),
+            "git_commit": ("local", lambda m: git_commit(m.group("git_commit_m"))),
+            "git_log": ("local", lambda m: git_log()),
+
+            "remote_echo": ("remote", lambda m: ("echo", {"texto": m.group("remote_echo_t")})),
+            "remote_morse": ("remote", lambda m: ("morse", {"texto": m.group("remote_morse_t")})),
+            "remote_demorse": ("remote", lambda m: ("demorse", {"codigo": m.group("remote_demorse_c")})),
+        }
         
     def initialize(self):
         print("\n🔍 Verificando servicios...")
@@ -391,14 +533,23 @@ class SimpleChatbot:
                 self.remote_tools = mcp_tools_list() or ["echo", "morse", "demorse"]
                 print(f"  • Tools remotos: {', '.join(self.remote_tools)}")
 
-        
+        # El catálogo de herramientas ya no cambia: se arma una sola vez
+        self._system_prompt = self.build_system_prompt()
+
+    def build_system_prompt(self) -> str:
+        return f"""Eres un asistente útil con acceso a herramientas locales y remotas.
+
+{self.get_tools_description()}
+
+Responde de manera natural y usa las herramientas cuando sea necesario.
+Mantén el contexto de la conversación."""
+
     def log_interaction(self, type: str, data: Any):
-        with open(LOG_FILE, 'a', encoding='utf-8') as f:
-            f.write(json.dumps({
-                "timestamp": datetime.now().isoformat(),
-                "type": type,
-                "data": data
-            }, ensure_ascii=False) + '\n')
+        _CHAT_WRITER.write(orjson.dumps({
+            "timestamp": datetime.now().isoformat(),
+            "type": type,
+            "data": data
+        }, option=orjson.OPT_NON_STR_KEYS) + b'\n')
     
     def get_tools_description(self) -> str:
         base_tools = """
@@ -446,94 +597,123 @@ Usa el formato exacto. Ejemplos:
 """
         return base_tools
     
-    def process_tool_calls(self, text: str) -> str:
+    def _dispatch_complete_tags(self, text: str, pos: int, pool: ThreadPoolExecutor,
+                                dispatched: Dict[Tuple[int, int, str], Future]) -> int:
+        """Lanza en segundo plano los tags DNS/REMOTE ya cerrados a partir de ``pos``.
+
+        Sólo se adelantan herramientas de lectura; si el escaneo final no
+        confirma el tag, su resultado simplemente se descarta.
+        """
+        for m in self._tool_re.finditer(text, pos):
+            kind, handler = self._tool_dispatch[m.lastgroup]
+            key = (m.start(), m.end(), m.lastgroup)
+            if kind == "dns" and key not in dispatched:
+                dispatched[key] = pool.submit(handler, m)
+            elif kind == "remote" and key not in dispatched:
+                dispatched[key] = pool.submit(call_remote_tool, *handler(m))
+            pos = m.end()
+        return pos
+
+    def process_tool_calls(self, text: str,
+                           dispatched: Optional[Dict[Tuple[int, int, str], Future]] = None) -> str:
         """Procesa las llamadas a herramientas en el texto"""
-        import re
-        
-        # Patrones para cada tipo de herramienta
-        patterns = [
-            # DNS Local
-            (r'\[DNS:\s*ping\]', lambda: call_dns_tool("ping", {})),
-            (r'\[DNS:\s*salud_dns\s+(\S+)\]', lambda m: call_dns_tool("salud_dns", {"dominio": m.group(1)})),
-            (r'\[DNS:\s*correo_politicas\s+(\S+)\]', lambda m: call_dns_tool("correo_politicas", {"dominio": m.group(1)})),
-            (r'\[DNS:\s*estado_dnssec\s+(\S+)\]', lambda m: call_dns_tool("estado_dnssec", {"dominio": m.group(1)})),
-            (r'\[DNS:\s*propagacion\s+(\S+)\]', lambda m: call_dns_tool("propagacion", {"dominio": m.group(1)})),
-            
-            # Archivos
-            (r'\[FILE:\s*list\]', lambda: list_files()),
-            (r'\[FILE:\s*read\s+(\S+)\]', lambda m: read_file(m.group(1))),
-            (r'\[FILE:\s*write\s+(\S+)\s+"([^"]+)"\]', lambda m: write_file(m.group(1), m.group(2))),
-            (r'\[FILE:\s*mkdir\s+(\S+)\]', lambda m: create_directory(m.group(1))),
-            
-            # Git
-            (r'\[GIT:\s*init\]', lambda: git_init()),
-            (r'\[GIT:\s*status\]', lambda: git_status()),
-            (r'\[GIT:\s*add\]', lambda: git_add()),
-            (r'\[GIT:\s*commit\s+"([^"]+)"\]', lambda m: git_commit(m.group(1))),
-            (r'\[GIT:\s*log\]', lambda: git_log()),
-            
-            # Servidor Remoto
-            # Servidor Remoto (CORRECTO)
-            (r'\[REMOTE:\s*echo\s+"([^"]+)"\]', lambda m: call_remote_echo(m.group(1))),
-            (r'\[REMOTE:\s*morse\s+"([^"]+)"\]', lambda m: call_remote_morse(m.group(1))),
-            (r'\[REMOTE:\s*demorse\s+"([^"]+)"\]', lambda m: call_remote_demorse(m.group(1))),
-        ]
-        
-        result_text = text
-        
-        for pattern, handler in patterns:
-            matches = list(re.finditer(pattern, text))
-            for match in reversed(matches):
-                try:
-                    if match.groups():
-                        result = handler(match)
-                    else:
-                        result = handler()
-                    
-                    self.log_interaction("tool_call", {
-                        "tool": match.group(0),
-                        "result": result
-                    })
-                    
-                    # Formatear resultado
-                    if isinstance(result, dict):
-                        if "error" in result:
-                            result_str = f"\n❌ Error: {result['error']}\n"
-                        elif "result" in result:
-                            result_str = f"\n✅ Resultado: {result['result']}\n"
-                        else:
-                            result_str = f"\n✅ Resultado:\n{json.dumps(result, indent=2, ensure_ascii=False)}\n"
+        dispatched = dispatched or {}
+
+        # Un solo escaneo: (match, tipo, función), ya en orden de aparición
+        found = [(m, *self._tool_dispatch[m.lastgroup]) for m in self._tool_re.finditer(text)]
+
+        results: List[Any] = [None] * len(found)
+
+        def run_local(match, handler):
+            try:
+                return handler(match)
+            except Exception as e:
+                return e
+
+        # Resultados ya lanzados durante el streaming de la respuesta
+        early = {i: dispatched[(f[0].start(), f[0].end(), f[0].lastgroup)] for i, f in enumerate(found)
+                 if (f[0].start(), f[0].end(), f[0].lastgroup) in dispatched}
+        remote_idx = [i for i, f in enumerate(found) if f[1] == "remote" and i not in early]
+        dns_idx = [i for i, f in enumerate(found) if f[1] == "dns" and i not in early]
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            # DNS y remotos son de solo lectura: corren en paralelo entre sí
+            futures = {i: pool.submit(run_local, found[i][0], found[i][2]) for i in dns_idx}
+            for i in remote_idx:
+                futures[i] = pool.submit(call_remote_tool, *found[i][2](found[i][0]))
+
+            # Archivos y Git en orden de aparición (write -> add -> commit)
+            for i, (match, kind, handler) in enumerate(found):
+                if kind == "local":
+                    results[i] = run_local(match, handler)
+
+            for i, fut in futures.items():
+                results[i] = fut.result()
+
+        for i, fut in early.items():
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                results[i] = e
+
+        # Se recorre el texto original una vez, alternando tramos y resultados
+        parts: List[str] = []
+        pos = 0
+        for (match, _, _), result in zip(found, results):
+            if isinstance(result, Exception):
+                result_str = f"\n❌ Error ejecutando herramienta: {result}\n"
+            else:
+                self.log_interaction("tool_call", {
+                    "tool": match.group(0),
+                    "result": result
+                })
+
+                # Formatear resultado
+                if isinstance(result, dict):
+                    if "error" in result:
+                        result_str = f"\n❌ Error: {result['error']}\n"
+                    elif "result" in result and isinstance(result["result"], str):
+                        result_str = f"\n✅ Resultado: {result['result']}\n"
+                    elif "result" in result:
+                        result_str = f"\n✅ Resultado:\n{json.dumps(result['result'], indent=2, ensure_ascii=False)}\n"
                     else:
-                        result_str = f"\n✅ Resultado: {result}\n"
-                    
-                    result_text = result_text[:match.start()] + result_str + result_text[match.end():]
-                    
-                except Exception as e:
-                    error_str = f"\n❌ Error ejecutando herramienta: {e}\n"
-                    result_text = result_text[:match.start()] + error_str + result_text[match.end():]
-        
-        return result_text
+                        result_str = f"\n✅ Resultado:\n{json.dumps(result, indent=2, ensure_ascii=False)}\n"
+                else:
+                    result_str = f"\n✅ Resultado: {result}\n"
+
+            parts.append(text[pos:match.start()])
+            parts.append(result_str)
+            pos = match.end()
+        parts.append(text[pos:])
+
+        return "".join(parts)
     
     def chat(self, user_input: str) -> str:
         self.conversation_history.append({"role": "user", "content": user_input})
-        
-        system_prompt = f"""Eres un asistente útil con acceso a herramientas locales y remotas.
 
-{self.get_tools_description()}
-
-Responde de manera natural y usa las herramientas cuando sea necesario.
-Mantén el contexto de la conversación."""
+        if self._system_prompt is None:
+            self._system_prompt = self.build_system_prompt()
         
         try:
-            response = self.client.messages.create(
-                model=ANTHROPIC_MODEL,
-                max_tokens=2000,
-                system=system_prompt,
-                messages=self.conversation_history
-            )
-            
-            assistant_response = response.content[0].text
-            final_response = self.process_tool_calls(assistant_response)
+            # Streaming: los tags DNS/REMOTE se ejecutan apenas se cierran,
+            # mientras el modelo sigue generando el resto de la respuesta
+            chunks: List[str] = []
+            dispatched: Dict[Tuple[int, int, str], Future] = {}
+            scan_pos = 0
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                with self.client.messages.stream(
+                    model=ANTHROPIC_MODEL,
+                    max_tokens=2000,
+                    system=self._system_prompt,
+                    messages=self.conversation_history
+                ) as stream:
+                    for chunk in stream.text_stream:
+                        chunks.append(chunk)
+                        if "]" in chunk:
+                            scan_pos = self._dispatch_complete_tags("".join(chunks), scan_pos, pool, dispatched)
+
+                assistant_response = "".join(chunks)
+                final_response = self.process_tool_calls(assistant_response, dispatched)
             
             self.conversation_history.append({"role": "assistant", "content": final_response})
             
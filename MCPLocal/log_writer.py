@@ -0,0 +1,88 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Union
+
+
+class BackgroundLogWriter:
+    """Escritor de logs append-only en un hilo daemon.
+
+    write() sólo encola la línea ya serializada; el hilo agrupa hasta
+    ``max_batch`` líneas (o lo que llegue en ``max_delay`` segundos) y las
+    escribe con un único os.write sobre un descriptor que queda abierto.
+    Al superar ``max_bytes`` el archivo se rota a ``<path>.<fecha>``.
+    """
+
+    def __init__(self, path: Union[str, Path], max_batch: int = 64, max_delay: float = 0.05,
+                 max_bytes: int = 32 * 1024 * 1024):
+        self.path = str(path)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        # SimpleQueue: put() no toma el lock de Queue ni lleva la cuenta de
+        # tareas, así que el coste en el hilo que registra es mínimo.
+        self._queue: "queue.SimpleQueue[Optional[bytes]]" = queue.SimpleQueue()
+        self._fd: Optional[int] = None
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, line: bytes) -> None:
+        self._queue.put(line)
+
+    def _open(self) -> int:
+        return os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._flush(batch)
+                    return
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: List[bytes]) -> None:
+        try:
+            if self._fd is None:
+                self._fd = self._open()
+            data = memoryview(b"".join(batch))
+            while data:
+                data = data[os.write(self._fd, data):]
+            if os.fstat(self._fd).st_size > self.max_bytes:
+                self._rotate()
+        except OSError:
+            pass
+
+    def _rotate(self) -> None:
+        os.close(self._fd)
+        self._fd = None
+        rotated = f"{self.path}.{time.strftime('%Y%m%d_%H%M%S')}"
+        n = 1
+        while os.path.exists(rotated if n == 1 else f"{rotated}.{n}"):
+            n += 1
+        os.replace(self.path, rotated if n == 1 else f"{rotated}.{n}")
+
+    def close(self) -> None:
+        """Vacía la cola y cierra el archivo (se registra en atexit)."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=2.0)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
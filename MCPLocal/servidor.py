@@ -1,11 +1,13 @@
 dependencies = [
     "dnspython>=2.6.1",
     "cryptography>=42.0.0",
+    "orjson>=3.9.0",
 ]
 
-import json, os, random, string, time
+import ipaddress, os, random, select, socket, string, time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict, dataclass
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 
 from mcp.server.fastmcp import FastMCP
 from mcp.server.session import ServerSession 
@@ -18,17 +20,36 @@ import dns.rdatatype
 import dns.dnssec
 import dns.exception
 import dns.flags
+import dns.inet
+import orjson
+
+from log_writer import BackgroundLogWriter
 
 LOG_PATH = os.environ.get("DNS_MCP_LOG", "dns_mcp.log.jsonl")
+_LOG_WRITER = BackgroundLogWriter(LOG_PATH)
+
+# Pool para consultas DNS independientes (sólo consultas hoja: las tareas del
+# pool nunca esperan a otras tareas del pool).
+_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="dns")
 
 def log_event(event: Dict[str, Any]) -> None:
     try:
         event["ts"] = time.time()
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        _LOG_WRITER.write(orjson.dumps(event) + b"\n")
     except Exception:
         pass
 
+def _finish(tool: str, dominio: str, start: float, out: Dict[str, Any]) -> Dict[str, Any]:
+    # Se registran conteos en vez del tamaño serializado para no codificar la
+    # salida dos veces (FastMCP ya la serializa al responder).
+    event = {"tool": tool, "dominio": dominio, "dur_ms": int(1000*(time.time()-start))}
+    if "hallazgos" in out:
+        event["hallazgos"] = len(out["hallazgos"])
+    if "respuestas" in out:
+        event["respuestas"] = len(out["respuestas"])
+    log_event(event)
+    return out
+
 def to_str_list(rrset) -> List[str]:
     try:
         return [r.to_text() for r in rrset] if rrset else []
@@ -38,17 +59,33 @@ def to_str_list(rrset) -> List[str]:
 def random_label(n: int = 10) -> str:
     return ''.join(random.choices(string.ascii_lowercase + string.digits, k=n))
 
-def make_resolver(servers: Optional[List[str]] = None, timeout: float = 3.0) -> dns.resolver.Resolver:
-    r = dns.resolver.Resolver()
-    r.lifetime = timeout
-    r.timeout = timeout
+# Resolver compartido: /etc/resolv.conf se lee una sola vez al importar
+_RESOLVER: Optional[dns.resolver.Resolver] = None
+
+def make_resolver(servers: Optional[List[str]] = None) -> dns.resolver.Resolver:
+    # Sin servidores explícitos se usa el resolver compartido (con caché).
+    # El timeout va por consulta en resolve_rr para no mutar estado compartido.
+    if not servers and _RESOLVER is not None:
+        return _RESOLVER
     if servers:
+        # Con servidores explícitos no hace falta leer /etc/resolv.conf
+        r = dns.resolver.Resolver(configure=False)
         r.nameservers = servers
-    return r
-
-def resolve_rr(resolver: dns.resolver.Resolver, name: str, rtype: str):
+        return r
+    return dns.resolver.Resolver()
+
+_RESOLVER = make_resolver()
+# Caché LRU que respeta el TTL de cada RRset; LRUCache es thread-safe.
+# Los resolvers por IP de propagacion no la comparten: la clave de la caché
+# no incluye el servidor y mezclaría respuestas de distintos resolutores.
+_RESOLVER.cache = dns.resolver.LRUCache(10_000)
+
+def resolve_rr(name: str, rtype: str, resolver: Optional[dns.resolver.Resolver] = None,
+               timeout: float = 3.0):
+    if resolver is None:
+        resolver = _RESOLVER
     try:
-        ans = resolver.resolve(name, rtype, raise_on_no_answer=False)
+        ans = resolver.resolve(name, rtype, raise_on_no_answer=False, lifetime=timeout)
         return ans.rrset, None
     except dns.resolver.NXDOMAIN:
         return None, "NXDOMAIN"
@@ -58,36 +95,103 @@ def resolve_rr(resolver: dns.resolver.Resolver, name: str, rtype: str):
         return None, f"DNS_ERROR:{type(e).__name__}"
 
 def get_authoritative_ns_ips(domain: str) -> List[str]:
-    res = make_resolver()
-    ns_rr, _ = resolve_rr(res, domain, "NS")
+    ns_rr, _ = resolve_rr(domain, "NS")
     if not ns_rr:
         return []
-    ips: List[str] = []
-    for ns in ns_rr:
-        host = str(ns.target).rstrip(".")
-        for typ in ("A", "AAAA"):
-            rr, _ = resolve_rr(res, host, typ)
-            if rr:
-                for r in rr:
-                    ip = getattr(r, "address", None)
-                    ips.append(ip if ip else str(r))
-    vistos, out = set(), []
-    for ip in ips:
-        if ip not in vistos:
-            vistos.add(ip)
-            out.append(ip)
+    hosts = [str(ns.target).rstrip(".") for ns in ns_rr]
+    # A/AAAA de todos los NS en una sola ola
+    futures = [_POOL.submit(resolve_rr, host, typ) for host in hosts for typ in ("A", "AAAA")]
+    # dict como conjunto ordenado: deduplica conservando el orden de aparición
+    ips: Dict[str, None] = {}
+    for fut in futures:
+        rr, _ = fut.result()
+        if rr:
+            for r in rr:
+                ip = getattr(r, "address", None)
+                ips.setdefault(ip if ip else str(r), None)
+    return list(ips)
+
+def multi_query_authoritative(name: str, rtypes: Sequence[str], ns_ips: Sequence[str],
+                              timeout: float = 3.0) -> Dict[Tuple[str, str], Any]:
+    """Envía todas las consultas (tipo x NS) por un socket UDP por familia y
+    espera las respuestas juntas con select. Devuelve {(rtype, ip): rrset | None}."""
+    out: Dict[Tuple[str, str], Any] = {(rt, ip): None for rt in rtypes for ip in ns_ips}
+    pending: Dict[Tuple[int, str], Tuple[str, str, dns.message.Message]] = {}
+    socks: Dict[int, socket.socket] = {}
+    try:
+        for ip in ns_ips:
+            norm = str(ipaddress.ip_address(ip))
+            af = dns.inet.af_for_address(ip)
+            sock = socks.get(af)
+            if sock is None:
+                sock = socks[af] = socket.socket(af, socket.SOCK_DGRAM)
+                sock.setblocking(False)
+            for rt in rtypes:
+                q = dns.message.make_query(name, rt, want_dnssec=True)
+                q.flags &= ~dns.flags.RD
+                while (q.id, norm) in pending:
+                    q.id = random.randint(0, 65535)
+                try:
+                    sock.sendto(q.to_wire(), (ip, 53))
+                except OSError:
+                    continue
+                pending[(q.id, norm)] = (rt, ip, q)
+
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select(list(socks.values()), [], [], remaining)
+            for sock in readable:
+                try:
+                    wire, addr = sock.recvfrom(65535)
+                    resp = dns.message.from_wire(wire)
+                except Exception:
+                    continue
+                key = (resp.id, str(ipaddress.ip_address(addr[0])))
+                entry = pending.get(key)
+                if entry is None or not entry[2].is_response(resp):
+                    continue
+                del pending[key]
+                if resp.answer:
+                    out[(entry[0], entry[1])] = resp.answer[0]
+    finally:
+        for sock in socks.values():
+            sock.close()
     return out
 
-def query_authoritative(name: str, rtype: str, ns_ip: str):
-    q = dns.message.make_query(name, rtype, want_dnssec=True)
-    q.flags &= ~dns.flags.RD  
-    try:
-        resp = dns.query.udp(q, ns_ip, timeout=3.0)
-        if resp.answer:
-            return resp.answer[0]
-        return None
-    except Exception:
-        return None
+def fetch_signed_soa(name: str, ns_ip: str, timeout: float = 3.0):
+    """SOA y RRSIG(SOA) de un autoritativo; reintenta por TCP si hace falta."""
+    q = dns.message.make_query(name, "SOA", want_dnssec=True)
+    q.flags &= ~dns.flags.RD
+    ans = dns.query.udp(q, ns_ip, timeout=timeout)
+    rrset_soa, rrsig_soa = _soa_and_sig(ans)
+    # si truncado o sin firmas, intentar TCP
+    if ans.flags & dns.flags.TC or not (rrset_soa and rrsig_soa):
+        try:
+            rrset_soa, rrsig_soa = _soa_and_sig(dns.query.tcp(q, ns_ip, timeout=timeout))
+        except Exception:
+            pass
+    return rrset_soa, rrsig_soa
+
+def _soa_and_sig(ans: dns.message.Message):
+    rrset_soa = None
+    rrsig_soa = None
+    for rrset in ans.answer:
+        if rrset.rdtype == dns.rdatatype.SOA:
+            rrset_soa = rrset
+        if rrset.rdtype == dns.rdatatype.RRSIG and rrset.covers() == dns.rdatatype.SOA:
+            rrsig_soa = rrset
+    return rrset_soa, rrsig_soa
+
+def find_txt(rrset, prefix: bytes) -> Optional[str]:
+    # Compara sobre los bytes crudos del TXT (cadenas ya unidas, sin comillas)
+    for r in rrset or ():
+        raw = b"".join(r.strings)
+        if raw[:len(prefix)].lower() == prefix:
+            return raw.decode("utf-8", "replace")
+    return None
 
 def flatten_rr_text(rrset) -> List[str]:
     if not rrset:
@@ -146,27 +250,34 @@ def salud_dns(dominio: str) -> Dict[str, Any]:
     start = time.time()
     hall: List[Hallazgo] = []
 
-    rec = make_resolver()
-    a_rr, _ = resolve_rr(rec, dominio, "A")
-    aaaa_rr, _ = resolve_rr(rec, dominio, "AAAA")
-    ns_rr, _ = resolve_rr(rec, dominio, "NS")
-    soa_rr, _ = resolve_rr(rec, dominio, "SOA")
-    cname_rr, _ = resolve_rr(rec, dominio, "CNAME")
+    # Consultas recursivas (y la sonda de comodín) en vuelo mientras se
+    # resuelven los autoritativos desde este hilo
+    test_sub = f"{random_label()}.{dominio}".rstrip(".")
+    rec = {typ: _POOL.submit(resolve_rr, dominio, typ) for typ in ("A", "AAAA", "NS", "SOA", "CNAME")}
+    rand_fut = _POOL.submit(resolve_rr, test_sub, "A")
 
     # Autoritativo
-    auth_ips = get_authoritative_ns_ips(dominio)
-    auth = {"A": [], "AAAA": [], "NS": [], "SOA": []}
-    for typ in ("A", "AAAA", "NS", "SOA"):
+    auth_ips = get_authoritative_ns_ips(dominio)[:4]
+    tipos = ("A", "AAAA", "NS", "SOA")
+    # Hasta 4 NS x 4 tipos en vuelo a la vez sobre un solo socket
+    respuestas_auth = multi_query_authoritative(dominio, tipos, auth_ips)
+    auth = {}
+    for typ in tipos:
         vistas = []
-        for ip in auth_ips[:4]:  #
-            rr = query_authoritative(dominio, typ, ip)
+        for ip in auth_ips:
+            rr = respuestas_auth[(typ, ip)]
             if rr:
                 vistas.extend(flatten_rr_text(rr))
         auth[typ] = sorted(list(set(vistas)))
 
+    a_rr, _ = rec["A"].result()
+    aaaa_rr, _ = rec["AAAA"].result()
+    ns_rr, _ = rec["NS"].result()
+    soa_rr, _ = rec["SOA"].result()
+    cname_rr, _ = rec["CNAME"].result()
+
     # Wildcard (comodín): probar subdominio aleatorio
-    test_sub = f"{random_label()}.{dominio}".rstrip(".")
-    rand_a, _ = resolve_rr(rec, test_sub, "A")
+    rand_a, _ = rand_fut.result()
     if rand_a and len(rand_a) > 0:
         hall.append(Hallazgo("wildcard", "warning",
                              f"Resuelve {test_sub} → {to_str_list(rand_a)} (posible comodín)"))
@@ -186,8 +297,9 @@ def salud_dns(dominio: str) -> Dict[str, Any]:
     if cname_rr:
         try:
             target = str(cname_rr[0].target).rstrip(".")
-            a_tgt, _ = resolve_rr(rec, target, "A")
-            aaaa_tgt, _ = resolve_rr(rec, target, "AAAA")
+            a_fut = _POOL.submit(resolve_rr, target, "A")
+            aaaa_tgt, _ = resolve_rr(target, "AAAA")
+            a_tgt, _ = a_fut.result()
             if not a_tgt and not aaaa_tgt:
                 hall.append(Hallazgo("cname_colgante", "error",
                                      f"CNAME apunta a {target} que no resuelve A/AAAA"))
@@ -205,46 +317,28 @@ def salud_dns(dominio: str) -> Dict[str, Any]:
         autoritativo=auth,
         hallazgos=hall,
     )
-    out = asdict(resultado)
-    log_event({"tool": "salud_dns", "dominio": dominio, "dur_ms": int(1000*(time.time()-start)), "out_size": len(json.dumps(out))})
-    return out
+    return _finish("salud_dns", dominio, start, asdict(resultado))
 
 @mcp.tool(description="Revisa MX/SPF/DMARC y reporta faltantes o configuraciones débiles.")
 def correo_politicas(dominio: str) -> Dict[str, Any]:
     start = time.time()
-    res = make_resolver()
     hall: List[Hallazgo] = []
 
-    mx_rr, _ = resolve_rr(res, dominio, "MX")
-    txt_rr, _ = resolve_rr(res, dominio, "TXT")
-    dmarc_rr, _ = resolve_rr(res, f"_dmarc.{dominio}", "TXT")
+    mx_rr, _ = resolve_rr(dominio, "MX")
+    txt_rr, _ = resolve_rr(dominio, "TXT")
+    dmarc_rr, _ = resolve_rr(f"_dmarc.{dominio}", "TXT")
 
     mx_list = []
     if mx_rr:
-        try:
-            mx_list = sorted([r.to_text() for r in mx_rr], key=lambda s: int(s.split()[0]))
-        except Exception:
-            mx_list = [r.to_text() for r in mx_rr]
+        mx_list = [f"{r.preference} {r.exchange.to_text()}" for r in sorted(mx_rr, key=lambda r: r.preference)]
     else:
         hall.append(Hallazgo("sin_mx", "warning", "El dominio no publica registros MX."))
 
-    spf_txt = None
-    if txt_rr:
-        for r in txt_rr:
-            txt = r.to_text().strip('"')
-            if txt.lower().startswith("v=spf1"):
-                spf_txt = txt
-                break
+    spf_txt = find_txt(txt_rr, b"v=spf1")
     if not spf_txt:
         hall.append(Hallazgo("sin_spf", "warning", "No se encontró SPF en TXT del apex."))
 
-    dmarc_txt = None
-    if dmarc_rr:
-        for r in dmarc_rr:
-            txt = r.to_text().strip('"')
-            if txt.lower().startswith("v=dmarc1"):
-                dmarc_txt = txt
-                break
+    dmarc_txt = find_txt(dmarc_rr, b"v=dmarc1")
     if not dmarc_txt:
         hall.append(Hallazgo("sin_dmarc", "warning", "No se encontró política DMARC en _dmarc."))
 
@@ -255,9 +349,7 @@ def correo_politicas(dominio: str) -> Dict[str, Any]:
         dmarc=dmarc_txt,
         hallazgos=hall,
     )
-    out = asdict(resultado)
-    log_event({"tool": "correo_politicas", "dominio": dominio, "dur_ms": int(1000*(time.time()-start)), "out_size": len(json.dumps(out))})
-    return out
+    return _finish("correo_politicas", dominio, start, asdict(resultado))
 
 def parent_zone(name: dns.name.Name) -> dns.name.Name:
     return dns.name.Name(name.labels[1:])
@@ -265,16 +357,20 @@ def parent_zone(name: dns.name.Name) -> dns.name.Name:
 @mcp.tool(description="Verifica DS/DNSKEY/RRSIG y valida firma de SOA contra DNSKEY (si es posible).")
 def estado_dnssec(dominio: str) -> Dict[str, Any]:
     start = time.time()
-    res = make_resolver()
     detalles: List[str] = []
     hall: List[Hallazgo] = []
 
     name = dns.name.from_text(dominio)
 
+    # DS y DNSKEY en vuelo mientras se resuelven los autoritativos
+    ds_fut = _POOL.submit(resolve_rr, dominio, "DS")
+    dnskey_fut = _POOL.submit(resolve_rr, dominio, "DNSKEY")
+    auth_ips = get_authoritative_ns_ips(dominio)[:4]
+
     # DS en el padre
     tiene_ds = False
     try:
-        ds_rr, _ = resolve_rr(res, dominio, "DS")
+        ds_rr, _ = ds_fut.result()
         if ds_rr and len(ds_rr) > 0:
             tiene_ds = True
             detalles.append(f"DS en el padre: {len(ds_rr)} registro(s).")
@@ -284,7 +380,9 @@ def estado_dnssec(dominio: str) -> Dict[str, Any]:
         detalles.append(f"Error consultando DS: {e}")
 
     #  DNSKEY en el apex
-    dnskey_rr, _ = resolve_rr(res, dominio, "DNSKEY")
+    dnskey_rr, _ = dnskey_fut.result()
+    # SOA firmado pedido a todos los autoritativos a la vez
+    soa_futs = [(ip, _POOL.submit(fetch_signed_soa, dominio, ip)) for ip in auth_ips] if dnskey_rr else []
     algos = []
     if dnskey_rr:
         for r in dnskey_rr:
@@ -299,11 +397,14 @@ def estado_dnssec(dominio: str) -> Dict[str, Any]:
     # Verificación DS <-> DNSKEY (huellas)
     if tiene_ds and dnskey_rr:
         try:
+            # Una huella por (clave, tipo de digest) en vez de una por (clave, DS)
+            ds_by_dt: Dict[int, set] = {}
+            for ds in ds_rr:
+                ds_by_dt.setdefault(ds.digest_type, set()).add(ds)
             matches = 0
             for key in dnskey_rr:
-                for ds in ds_rr:
-                    calc = dns.dnssec.make_ds(name, key, ds.digest_type)
-                    if calc == ds:
+                for dt, dss in ds_by_dt.items():
+                    if dns.dnssec.make_ds(name, key, dt) in dss:
                         matches += 1
             if matches == 0:
                 hall.append(Hallazgo("ds_dnskey_mismatch", "error",
@@ -313,40 +414,14 @@ def estado_dnssec(dominio: str) -> Dict[str, Any]:
 
     # Validar firma de SOA usando autoritativos 
     soa_signed_ok: Optional[bool] = None
-    auth_ips = get_authoritative_ns_ips(dominio)
-    if auth_ips and dnskey_rr:
-        for ip in auth_ips[:4]:
+    if soa_futs:
+        # dnspython busca las claves por nombre del firmante y filtra por
+        # key_tag/algoritmo él mismo; se arma una sola vez fuera del bucle.
+        keyring = {name: dnskey_rr}
+        for ip, fut in soa_futs:
             try:
-                q = dns.message.make_query(dominio, "SOA", want_dnssec=True)
-                q.flags &= ~dns.flags.RD
-                ans = dns.query.udp(q, ip, timeout=3.0)
-                # si truncado o sin firmas, intentar TCP
-                need_tcp = bool(ans.flags & dns.flags.TC)
-                rrset_soa = None
-                rrsig_soa = None
-                for rrset in ans.answer:
-                    if rrset.rdtype == dns.rdatatype.SOA:
-                        rrset_soa = rrset
-                    if rrset.rdtype == dns.rdatatype.RRSIG and rrset.covers() == dns.rdatatype.SOA:
-                        rrsig_soa = rrset
-                if need_tcp or not (rrset_soa and rrsig_soa):
-                    try:
-                        ans = dns.query.tcp(q, ip, timeout=3.0)
-                        rrset_soa = None
-                        rrsig_soa = None
-                        for rrset in ans.answer:
-                            if rrset.rdtype == dns.rdatatype.SOA:
-                                rrset_soa = rrset
-                            if rrset.rdtype == dns.rdatatype.RRSIG and rrset.covers() == dns.rdatatype.SOA:
-                                rrsig_soa = rrset
-                    except Exception:
-                        pass
-
+                rrset_soa, rrsig_soa = fut.result()
                 if rrset_soa and rrsig_soa:
-                    keyring = {}
-                    zone_name = dns.name.from_text(dominio.rstrip("."))
-                    for k in dnskey_rr:
-                        keyring[(zone_name, k.key_tag(), k.algorithm)] = k
                     dns.dnssec.validate(rrset_soa, rrsig_soa, keyring)
                     soa_signed_ok = True
                     detalles.append("SOA validado contra RRSIG y DNSKEY (autoritativo).")
@@ -368,9 +443,7 @@ def estado_dnssec(dominio: str) -> Dict[str, Any]:
         detalles=detalles,
         hallazgos=hall,
     )
-    out = asdict(resultado)
-    log_event({"tool": "estado_dnssec", "dominio": dominio, "dur_ms": int(1000*(time.time()-start)), "out_size": len(json.dumps(out))})
-    return out
+    return _finish("estado_dnssec", dominio, start, asdict(resultado))
 
 @mcp.tool(description="Compara respuestas entre resolutores (A/AAAA/NS) para ver propagación.")
 def propagacion(dominio: str, resolutores: Optional[List[str]] = None) -> Dict[str, Any]:
@@ -378,13 +451,19 @@ def propagacion(dominio: str, resolutores: Optional[List[str]] = None) -> Dict[s
     if not resolutores:
         resolutores = ["1.1.1.1", "8.8.8.8", "9.9.9.9"]
 
-    respuestas: Dict[str, Dict[str, Any]] = {}
+    # Todas las consultas (resolutor x tipo) salen a la vez
+    futures = {}
     for ip in resolutores:
         r = make_resolver([ip])
-        a_rr, _ = resolve_rr(r, dominio, "A")
-        aaaa_rr, _ = resolve_rr(r, dominio, "AAAA")
-        ns_rr, _ = resolve_rr(r, dominio, "NS")
-        txt_rr, _ = resolve_rr(r, dominio, "TXT")
+        for typ in ("A", "AAAA", "NS", "TXT"):
+            futures[(ip, typ)] = _POOL.submit(resolve_rr, dominio, typ, r)
+
+    respuestas: Dict[str, Dict[str, Any]] = {}
+    for ip in resolutores:
+        a_rr, _ = futures[(ip, "A")].result()
+        aaaa_rr, _ = futures[(ip, "AAAA")].result()
+        ns_rr, _ = futures[(ip, "NS")].result()
+        txt_rr, _ = futures[(ip, "TXT")].result()
         txt_sample = [t.to_text().strip('"') for t in (txt_rr or [])][:3]
         respuestas[ip] = {
             "A": to_str_list(a_rr),
@@ -406,6 +485,4 @@ def propagacion(dominio: str, resolutores: Optional[List[str]] = None) -> Dict[s
         respuestas=respuestas,
         diferencias=diffs,
     )
-    out = asdict(resultado)
-    log_event({"tool": "propagacion", "dominio": dominio, "dur_ms": int(1000*(time.time()-start)), "out_size": len(json.dumps(out))})
-    return out
+    return _finish("propagacion", dominio, start, asdict(resultado))
@@ -1,30 +1,47 @@
 import os
 import json
+import stat
+import fnmatch
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from mcp.server.fastmcp import FastMCP
 
 # Configuración
 WORKSPACE_DIR = Path(os.environ.get("MCP_WORKSPACE", "./workspace"))
 WORKSPACE_DIR.mkdir(exist_ok=True)
 
+# Archivos más grandes se leen por bloques y sólo se devuelve un extracto
+LARGE_FILE_BYTES = 1_000_000
+READ_CHUNK = 1 << 20
+PREVIEW_LINES = 20
+PREVIEW_BYTES = 4096
+
 # Crear servidor MCP
 mcp = FastMCP("Filesystem-Simple")
 
+def _resolve(path: str) -> Tuple[Path, Optional[os.stat_result]]:
+    # Un único stat por herramienta: existencia y tipo salen del mismo resultado
+    item_path = WORKSPACE_DIR / path
+    try:
+        return item_path, os.stat(item_path)
+    except (FileNotFoundError, NotADirectoryError):
+        return item_path, None
+
 @mcp.tool(description="Lista archivos y directorios en una ruta")
 def list_files(path: str = ".") -> Dict[str, Any]:
     try:
-        target_path = WORKSPACE_DIR / path
-        if not target_path.exists():
+        target_path, st = _resolve(path)
+        if st is None:
             return {"error": f"La ruta {path} no existe"}
         
         items = []
-        for item in target_path.iterdir():
-            items.append({
-                "name": item.name,
-                "type": "directory" if item.is_dir() else "file",
-                "size": item.stat().st_size if item.is_file() else None
-            })
+        with os.scandir(target_path) as it:
+            for entry in it:
+                items.append({
+                    "name": entry.name,
+                    "type": "directory" if entry.is_dir() else "file",
+                    "size": entry.stat().st_size if entry.is_file() else None
+                })
         
         return {
             "path": str(path),
@@ -37,23 +54,49 @@ def list_files(path: str = ".") -> Dict[str, Any]:
 @mcp.tool(description="Lee el contenido de un archivo")
 def read_file(path: str) -> Dict[str, Any]:
     try:
-        file_path = WORKSPACE_DIR / path
-        if not file_path.exists():
+        file_path, st = _resolve(path)
+        if st is None:
             return {"error": f"El archivo {path} no existe"}
         
-        if not file_path.is_file():
+        if not stat.S_ISREG(st.st_mode):
             return {"error": f"{path} no es un archivo"}
         
-        content = file_path.read_text(encoding='utf-8')
+        if st.st_size > LARGE_FILE_BYTES:
+            return _read_large(file_path, path, st.st_size)
+        
+        # Contar saltos sobre los bytes y decodificar una sola vez
+        data = file_path.read_bytes()
+        content = data.decode('utf-8')
         return {
             "path": str(path),
             "content": content,
             "size": len(content),
-            "lines": content.count('\n') + 1
+            "lines": data.count(b'\n') + 1
         }
     except Exception as e:
         return {"error": str(e)}
 
+def _read_large(file_path: Path, path: str, size: int) -> Dict[str, Any]:
+    # Cuenta líneas por bloques de 1 MiB sin cargar el archivo completo
+    newlines = 0
+    with open(file_path, "rb") as f:
+        first = f.read(READ_CHUNK)
+        newlines += first.count(b"\n")
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            newlines += chunk.count(b"\n")
+        f.seek(max(0, size - PREVIEW_BYTES))
+        last = f.read()
+    # Extracto acotado por líneas y por bytes (una sola línea enorme no cabe entera)
+    head = b"\n".join(first[:PREVIEW_BYTES].split(b"\n", PREVIEW_LINES)[:PREVIEW_LINES])
+    tail = b"\n".join(last.split(b"\n")[-PREVIEW_LINES:])
+    return {
+        "path": str(path),
+        "truncated": True,
+        "size": size,
+        "lines": newlines + 1,
+        "preview": head.decode("utf-8", "replace") + "\n...\n" + tail.decode("utf-8", "replace")
+    }
+
 @mcp.tool(description="Escribe contenido a un archivo")
 def write_file(path: str, content: str) -> Dict[str, Any]:
     try:
@@ -77,8 +120,8 @@ def write_file(path: str, content: str) -> Dict[str, Any]:
 @mcp.tool(description="Crea un directorio")
 def create_directory(path: str) -> Dict[str, Any]:
     try:
-        dir_path = WORKSPACE_DIR / path
-        if dir_path.exists():
+        dir_path, st = _resolve(path)
+        if st is not None:
             return {"error": f"El directorio {path} ya existe"}
         
         dir_path.mkdir(parents=True, exist_ok=True)
@@ -93,14 +136,14 @@ def create_directory(path: str) -> Dict[str, Any]:
 @mcp.tool(description="Elimina un archivo o directorio")
 def delete_item(path: str) -> Dict[str, Any]:
     try:
-        item_path = WORKSPACE_DIR / path
-        if not item_path.exists():
+        item_path, st = _resolve(path)
+        if st is None:
             return {"error": f"{path} no existe"}
         
-        if item_path.is_file():
+        if stat.S_ISREG(st.st_mode):
             item_path.unlink()
             return {"path": str(path), "deleted": True, "type": "file"}
-        elif item_path.is_dir():
+        elif stat.S_ISDIR(st.st_mode):
             import shutil
             shutil.rmtree(item_path)
             return {"path": str(path), "deleted": True, "type": "directory"}
@@ -111,10 +154,10 @@ def delete_item(path: str) -> Dict[str, Any]:
 @mcp.tool(description="Mueve o renombra un archivo o directorio")
 def move_item(source: str, destination: str) -> Dict[str, Any]:
     try:
-        source_path = WORKSPACE_DIR / source
+        source_path, st = _resolve(source)
         dest_path = WORKSPACE_DIR / destination
         
-        if not source_path.exists():
+        if st is None:
             return {"error": f"El origen {source} no existe"}
         
         # Crear directorios padre del destino si no existen
@@ -133,46 +176,78 @@ def move_item(source: str, destination: str) -> Dict[str, Any]:
 @mcp.tool(description="Obtiene información sobre un archivo o directorio")
 def get_info(path: str) -> Dict[str, Any]:
     try:
-        item_path = WORKSPACE_DIR / path
-        if not item_path.exists():
+        item_path, st = _resolve(path)
+        if st is None:
             return {"error": f"{path} no existe"}
         
-        stat = item_path.stat()
+        is_dir = stat.S_ISDIR(st.st_mode)
         info = {
             "path": str(path),
-            "type": "directory" if item_path.is_dir() else "file",
-            "size": stat.st_size,
-            "created": stat.st_ctime,
-            "modified": stat.st_mtime,
-            "accessed": stat.st_atime
+            "type": "directory" if is_dir else "file",
+            "size": st.st_size,
+            "created": st.st_ctime,
+            "modified": st.st_mtime,
+            "accessed": st.st_atime
         }
         
-        if item_path.is_dir():
-            # Contar elementos en el directorio
-            items = list(item_path.iterdir())
-            info["items_count"] = len(items)
-            info["files_count"] = sum(1 for i in items if i.is_file())
-            info["dirs_count"] = sum(1 for i in items if i.is_dir())
+        if is_dir:
+            # Contar elementos en el directorio (una sola pasada)
+            items = files = dirs = 0
+            with os.scandir(item_path) as it:
+                for entry in it:
+                    items += 1
+                    if entry.is_file():
+                        files += 1
+                    elif entry.is_dir():
+                        dirs += 1
+            info["items_count"] = items
+            info["files_count"] = files
+            info["dirs_count"] = dirs
         
         return info
     except Exception as e:
         return {"error": str(e)}
 
+def _walk(root: str, rel: str):
+    # Recorrido con os.scandir: el tipo de cada entrada viene del propio
+    # listado del directorio, sin un stat() extra por archivo
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+    with it:
+        for entry in it:
+            entry_rel = os.path.join(rel, entry.name) if rel else entry.name
+            yield entry, entry_rel
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk(entry.path, entry_rel)
+
 @mcp.tool(description="Busca archivos por patrón en el workspace")
 def search_files(pattern: str, path: str = ".") -> Dict[str, Any]:
     try:
-        import glob
         search_path = WORKSPACE_DIR / path
+        rel = search_path.relative_to(WORKSPACE_DIR)
         
         # Buscar recursivamente
         matches = []
-        for match in search_path.rglob(pattern):
-            relative_path = match.relative_to(WORKSPACE_DIR)
-            matches.append({
-                "path": str(relative_path),
-                "type": "directory" if match.is_dir() else "file",
-                "size": match.stat().st_size if match.is_file() else None
-            })
+        if "/" in pattern or "**" in pattern:
+            # Patrones con ruta: rglob los compara por segmentos
+            for match in search_path.rglob(pattern):
+                matches.append({
+                    "path": str(match.relative_to(WORKSPACE_DIR)),
+                    "type": "directory" if match.is_dir() else "file",
+                    "size": match.stat().st_size if match.is_file() else None
+                })
+        else:
+            # Patrones de nombre: recorrido con scandir
+            for entry, relative_path in _walk(str(search_path), "" if rel == Path(".") else str(rel)):
+                if not fnmatch.fnmatchcase(entry.name, pattern):
+                    continue
+                matches.append({
+                    "path": relative_path,
+                    "type": "directory" if entry.is_dir() else "file",
+                    "size": entry.stat().st_size if entry.is_file() else None
+                })
         
         return {
             "pattern": pattern,
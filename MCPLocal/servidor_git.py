@@ -1,10 +1,19 @@
 import os
+import re
 import json
 import subprocess
+from itertools import islice
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from mcp.server.fastmcp import FastMCP
 
+# pygit2 es opcional: si está instalado, las consultas de solo lectura
+# (log, ramas) se hacen en proceso sin lanzar git cada vez
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
 # Configuración
 WORKSPACE_DIR = Path(os.environ.get("MCP_WORKSPACE", "./workspace"))
 WORKSPACE_DIR.mkdir(exist_ok=True)
@@ -12,7 +21,25 @@ WORKSPACE_DIR.mkdir(exist_ok=True)
 # Crear servidor MCP
 mcp = FastMCP("Git-Simple")
 
-def run_git_command(args: List[str], cwd: Path = None) -> Dict[str, Any]:
+_REPOS: Dict[str, Any] = {}
+
+def open_repo(repo_path: Path):
+    """Repositorio pygit2 cacheado por ruta, o None si no hay pygit2/repo."""
+    if pygit2 is None:
+        return None
+    key = str(repo_path)
+    repo = _REPOS.get(key)
+    if repo is None:
+        try:
+            repo = pygit2.Repository(key)
+        except (pygit2.GitError, KeyError, OSError):
+            return None
+        _REPOS[key] = repo
+    return repo
+
+_COMMIT_HASH_RE = re.compile(r"^\[[^\]\n]* ([0-9a-f]{7,40})\]", re.MULTILINE)
+
+def run_git_command(args: List[str], cwd: Path = None, text: bool = True) -> Dict[str, Any]:
     if cwd is None:
         cwd = WORKSPACE_DIR
     
@@ -21,7 +48,7 @@ def run_git_command(args: List[str], cwd: Path = None) -> Dict[str, Any]:
             ["git"] + args,
             cwd=cwd,
             capture_output=True,
-            text=True,
+            text=text,
             check=False
         )
         
@@ -50,6 +77,8 @@ def git_init(path: str = ".") -> Dict[str, Any]:
     result = run_git_command(["init"], repo_path)
     
     if result["success"]:
+        # Una ruta cacheada podía apuntar a un repo padre
+        _REPOS.clear()
         # Configurar usuario por defecto si no está configurado
         run_git_command(["config", "user.name", "MCP User"], repo_path)
         run_git_command(["config", "user.email", "mcp@example.com"], repo_path)
@@ -68,11 +97,10 @@ def git_init(path: str = ".") -> Dict[str, Any]:
 @mcp.tool(description="Muestra el estado del repositorio Git")
 def git_status(path: str = ".") -> Dict[str, Any]:
     repo_path = WORKSPACE_DIR / path
-    result = run_git_command(["status", "--porcelain"], repo_path)
+    # Rama y estado en una sola llamada
+    result = run_git_command(["status", "--porcelain=v2", "--branch"], repo_path)
     
     if result["success"]:
-        lines = result["stdout"].strip().split("\n") if result["stdout"].strip() else []
-        
         files = {
             "modified": [],
             "added": [],
@@ -80,16 +108,34 @@ def git_status(path: str = ".") -> Dict[str, Any]:
             "untracked": [],
             "renamed": []
         }
+        current_branch = "main"
+        entries = 0
         
-        for line in lines:
+        for line in result["stdout"].split("\n"):
             if not line:
                 continue
-            status = line[:2]
-            filename = line[3:]
+            kind = line[0]
+            if kind == "#":
+                if line.startswith("# branch.head "):
+                    head = line[14:]
+                    current_branch = "" if head == "(detached)" else head
+                continue
+            entries += 1
+            if kind == "?":
+                files["untracked"].append(line[2:])
+                continue
+            if kind == "1":
+                filename = line.split(" ", 8)[8]
+            elif kind == "2":
+                new_name, _, orig = line.split(" ", 9)[9].partition("\t")
+                filename = f"{orig} -> {new_name}"
+            elif kind == "u":
+                filename = line.split(" ", 10)[10]
+            else:
+                continue
+            status = line[2:4]
             
-            if status == "??":
-                files["untracked"].append(filename)
-            elif status[0] == "M" or status[1] == "M":
+            if status[0] == "M" or status[1] == "M":
                 files["modified"].append(filename)
             elif status[0] == "A":
                 files["added"].append(filename)
@@ -98,14 +144,10 @@ def git_status(path: str = ".") -> Dict[str, Any]:
             elif status[0] == "R":
                 files["renamed"].append(filename)
         
-        # También obtener la rama actual
-        branch_result = run_git_command(["branch", "--show-current"], repo_path)
-        current_branch = branch_result["stdout"].strip() if branch_result["success"] else "main"
-        
         return {
             "branch": current_branch,
             "files": files,
-            "clean": len(lines) == 0,
+            "clean": entries == 0,
             "summary": f"{len(files['untracked'])} sin seguimiento, {len(files['modified'])} modificados, {len(files['added'])} añadidos"
         }
     else:
@@ -149,9 +191,13 @@ def git_commit(message: str, path: str = ".") -> Dict[str, Any]:
     result = run_git_command(["commit", "-m", message], repo_path)
     
     if result["success"]:
-        # Obtener el hash del commit
-        hash_result = run_git_command(["rev-parse", "HEAD"], repo_path)
-        commit_hash = hash_result["stdout"].strip()[:7] if hash_result["success"] else "unknown"
+        # El hash viene en la primera línea: "[rama (root-commit) abc1234] mensaje"
+        m = _COMMIT_HASH_RE.search(result["stdout"])
+        if m:
+            commit_hash = m.group(1)[:7]
+        else:
+            hash_result = run_git_command(["rev-parse", "HEAD"], repo_path)
+            commit_hash = hash_result["stdout"].strip()[:7] if hash_result["success"] else "unknown"
         
         return {
             "committed": True,
@@ -174,24 +220,48 @@ def git_commit(message: str, path: str = ".") -> Dict[str, Any]:
 def git_log(limit: int = 10, path: str = ".") -> Dict[str, Any]:
     repo_path = WORKSPACE_DIR / path
     
+    repo = open_repo(repo_path)
+    if repo is not None and not repo.head_is_unborn:
+        commits = []
+        # TOPOLOGICAL|TIME reproduce el orden de git log aun con commits del mismo segundo
+        walker = repo.walk(repo.head.target, pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_TIME)
+        for commit in islice(walker, None if limit < 0 else limit):
+            author = commit.author
+            commits.append({
+                "hash": str(commit.id)[:7],
+                "author": author.name,
+                "email": author.email,
+                "timestamp": str(author.time),
+                # Igual que %s: primer párrafo en una línea
+                "message": commit.message.strip().split("\n\n", 1)[0].replace("\n", " ")
+            })
+        return {
+            "commits": commits,
+            "count": len(commits),
+            "limit": limit
+        }
+    
+    # Registros separados por NUL; se decodifica campo a campo
     result = run_git_command(
-        ["log", f"--max-count={limit}", "--pretty=format:%H|%an|%ae|%at|%s"],
-        repo_path
+        ["log", f"--max-count={limit}", "--pretty=format:%H|%an|%ae|%at|%s%x00"],
+        repo_path,
+        text=False
     )
     
     if result["success"]:
         commits = []
-        for line in result["stdout"].strip().split("\n"):
-            if not line:
+        for record in result["stdout"].split(b"\x00"):
+            record = record.lstrip(b"\n")
+            if not record:
                 continue
-            parts = line.split("|")
-            if len(parts) >= 5:
+            parts = record.split(b"|", 4)
+            if len(parts) == 5:
                 commits.append({
-                    "hash": parts[0][:7],
-                    "author": parts[1],
-                    "email": parts[2],
-                    "timestamp": parts[3],
-                    "message": parts[4]
+                    "hash": parts[0][:7].decode("ascii"),
+                    "author": parts[1].decode("utf-8", "replace"),
+                    "email": parts[2].decode("utf-8", "replace"),
+                    "timestamp": parts[3].decode("ascii"),
+                    "message": parts[4].decode("utf-8", "replace")
                 })
         
         return {
@@ -202,7 +272,7 @@ def git_log(limit: int = 10, path: str = ".") -> Dict[str, Any]:
     else:
         return {
             "error": "No es un repositorio Git o error al obtener historial",
-            "details": result.get("stderr", "")
+            "details": result.get("stderr", b"").decode("utf-8", "replace")
         }
 
 @mcp.tool(description="Crea una nueva rama")
@@ -250,6 +320,18 @@ def git_branches(path: str = ".") -> Dict[str, Any]:
     """Lista todas las ramas del repositorio"""
     repo_path = WORKSPACE_DIR / path
     
+    repo = open_repo(repo_path)
+    if repo is not None and not repo.head_is_detached:
+        branches = sorted(repo.branches.local) + [
+            f"remotes/{name}" for name in sorted(repo.branches.remote) if not name.endswith("/HEAD")
+        ]
+        current = None if repo.head_is_unborn else repo.head.shorthand
+        return {
+            "branches": branches,
+            "current": current,
+            "count": len(branches)
+        }
+    
     result = run_git_command(["branch", "-a"], repo_path)
     
     if result["success"]:
@@ -1,10 +1,17 @@
 import os
 import json
 import time
+import atexit
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 from pathlib import Path
-import uuid
+import itertools
 from typing import Dict, Any, List
 import logging
 from urllib.parse import urlparse
@@ -25,8 +32,49 @@ logging.basicConfig(
     ]
 )
 
+# Clasificación de mensajes: método -> tipo, y clave del result -> tipo
+# (en orden de prioridad)
+_METHOD_MAP = {
+    "initialize": "SYNC_INITIALIZE",
+    "initialized": "SYNC_INITIALIZED",
+    "shutdown": "SYNC_SHUTDOWN",
+    "tools/list": "REQUEST_LIST_TOOLS",
+}
+_RESULT_KEY_MAP = (
+    ("capabilities", "RESPONSE_INITIALIZE"),
+    ("tools", "RESPONSE_LIST_TOOLS"),
+    ("content", "RESPONSE_TOOL_CALL"),
+)
+
 class JSONRPCAnalyzer:
     
+    SCENARIOS = [
+        ("1. INICIALIZACIÓN", "initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {}
+        }),
+        ("2. LISTAR HERRAMIENTAS", "tools/list", {}),
+        ("3. LLAMAR ECHO", "tools/call", {
+            "name": "echo",
+            "arguments": {"texto": "Hola desde Wireshark analysis"}
+        }),
+        ("4. LLAMAR MORSE", "tools/call", {
+            "name": "morse",
+            "arguments": {"texto": "SOS"}
+        }),
+        ("5. LLAMAR DEMORSE", "tools/call", {
+            "name": "demorse",
+            "arguments": {"codigo": "... --- ..."}
+        }),
+    ]
+    
+    # Los cuerpos son fijos salvo el id: se serializan una vez sin la llave
+    # de cierre y en cada envío sólo se concatena ',"id":"req-N"}'
+    _PRESERIALIZED = [
+        (title, method, orjson.dumps({"jsonrpc": "2.0", "method": method, "params": params})[:-1])
+        for title, method, params in SCENARIOS
+    ]
+    
     def __init__(self, server_url: str):
         self.server_url = server_url
         self.session_id = None
@@ -34,17 +82,70 @@ class JSONRPCAnalyzer:
         self.messages = []
         self.message_counter = 0
         
+        # Cada mensaje se agrega como una línea JSONL; el JSON completo
+        # (capture_file) se escribe una sola vez en close()
+        self.stream_file = self.capture_file.with_suffix('.jsonl')
+        self._fh = open(self.stream_file, 'ab', buffering=1 << 16)
+        # Líneas ya serializadas pendientes; se vuelcan cada 32 o cada segundo
+        self._pending = deque()
+        self._flush_every = 32
+        self._flush_interval = 1.0
+        self._last_flush = time.monotonic()
+        atexit.register(self.close)
+        # El hook se ejecuta desde varios hilos en run_test_scenario
+        self._lock = threading.Lock()
+        
+        # Contadores del resumen, actualizados en cada mensaje
+        self.type_counts = Counter()
+        self.direction_counts = Counter()
+        self.latency_min = float("inf")
+        self.latency_max = 0.0
+        self.latency_sum = 0.0
+        
         # Crear sesión con hooks para logging
+        self._ids = itertools.count(1)
+        
         self.session = requests.Session()
         self.session.hooks['response'] = [self.log_response]
+        # Pool explícito (keep-alive) y reintentos de 502/503/504 con backoff;
+        # timeouts y errores de conexión no se repiten (tools/call no es idempotente)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=3,
+                connect=False,
+                read=False,
+                other=0,
+                status=3,
+                backoff_factor=0.2,
+                status_forcelist=[502, 503, 504],
+                allowed_methods=["POST"],
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Accept": "application/json, text/event-stream",
+        })
         
     def log_response(self, resp, *args, **kwargs):
+        with self._lock:
+            self._log_response(resp)
+    
+    def _log_response(self, resp):
         self.message_counter += 1
+        # Un solo datetime por intercambio; la petición salió hace resp.elapsed
+        now = datetime.now()
+        ts_resp = now.isoformat(timespec='milliseconds')
+        ts_req = (now - resp.elapsed).isoformat(timespec='milliseconds')
         
         # Información de la petición
         request_info = {
             "message_num": self.message_counter,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": ts_req,
             "direction": "REQUEST",
             "method": resp.request.method,
             "url": resp.request.url,
@@ -53,21 +154,18 @@ class JSONRPCAnalyzer:
         }
         
         # Intentar parsear el body de la petición
+        # (json.loads acepta bytes directamente)
         if resp.request.body:
             try:
-                if isinstance(resp.request.body, bytes):
-                    body_str = resp.request.body.decode('utf-8')
-                else:
-                    body_str = resp.request.body
-                request_info["body"] = json.loads(body_str)
+                request_info["body"] = json.loads(resp.request.body)
                 request_info["jsonrpc_type"] = self.classify_jsonrpc_message(request_info["body"])
             except:
-                request_info["body"] = str(resp.request.body)[:500]
+                request_info["body"] = str(resp.request.body[:500])
         
         # Información de la respuesta
         response_info = {
             "message_num": self.message_counter,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": ts_resp,
             "direction": "RESPONSE",
             "status_code": resp.status_code,
             "headers": dict(resp.headers),
@@ -77,14 +175,28 @@ class JSONRPCAnalyzer:
         
         # Intentar parsear el body de la respuesta
         try:
-            response_info["body"] = resp.json()
+            response_info["body"] = json.loads(resp.content)
             response_info["jsonrpc_type"] = self.classify_jsonrpc_message(response_info["body"])
         except:
-            response_info["body"] = resp.text[:500]
+            # Sólo se decodifica el fragmento que se guarda
+            response_info["body"] = resp.content[:500].decode('utf-8', errors='replace')
         
         # Guardar mensajes
         self.messages.append(request_info)
         self.messages.append(response_info)
+        self.type_counts[request_info.get("jsonrpc_type", "UNKNOWN")] += 1
+        self.type_counts[response_info.get("jsonrpc_type", "UNKNOWN")] += 1
+        self.direction_counts["REQUEST"] += 1
+        self.direction_counts["RESPONSE"] += 1
+        latency = response_info["latency_ms"]
+        self.latency_min = min(self.latency_min, latency)
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_sum += latency
+        self._pending.append(orjson.dumps(request_info, default=str) + b"\n")
+        self._pending.append(orjson.dumps(response_info, default=str) + b"\n")
+        if (len(self._pending) >= self._flush_every
+                or time.monotonic() - self._last_flush >= self._flush_interval):
+            self._flush()
         
         # Log detallado
         logging.info(f"={'='*60}")
@@ -101,75 +213,47 @@ class JSONRPCAnalyzer:
         if response_info.get('jsonrpc_type'):
             logging.info(f"Type: {response_info['jsonrpc_type']}")
         
-        # Guardar en archivo
-        self.save_capture()
-        
     def classify_jsonrpc_message(self, body: Any) -> str:
         if not isinstance(body, dict):
             return "NON_JSONRPC"
         
         # Peticiones
         if "method" in body:
-            method = body.get("method", "")
-            
-            # Mensajes de sincronización/inicialización
-            if method == "initialize":
-                return "SYNC_INITIALIZE"
-            elif method == "initialized":
-                return "SYNC_INITIALIZED"
-            elif method == "shutdown":
-                return "SYNC_SHUTDOWN"
-            
-            # Peticiones de herramientas
-            elif method == "tools/list":
-                return "REQUEST_LIST_TOOLS"
-            elif method == "tools/call":
+            method = body["method"]
+            kind = _METHOD_MAP.get(method)
+            if kind:
+                return kind
+            if method == "tools/call":
                 tool_name = body.get("params", {}).get("name", "unknown")
                 return f"REQUEST_CALL_TOOL_{tool_name}"
-            
-            # Otros métodos
-            else:
-                return f"REQUEST_{method.upper()}"
+            return f"REQUEST_{(method or '').upper()}"
         
         # Respuestas
-        elif "result" in body or "error" in body:
-            if "result" in body:
-                # Intentar identificar el tipo de respuesta
-                result = body.get("result", {})
-                if isinstance(result, dict):
-                    if "capabilities" in result:
-                        return "RESPONSE_INITIALIZE"
-                    elif "tools" in result:
-                        return "RESPONSE_LIST_TOOLS"
-                    elif "content" in result:
-                        return "RESPONSE_TOOL_CALL"
-                return "RESPONSE_SUCCESS"
-            else:
-                return "RESPONSE_ERROR"
+        if "result" in body:
+            result = body["result"]
+            if isinstance(result, dict):
+                return next((v for k, v in _RESULT_KEY_MAP if k in result), "RESPONSE_SUCCESS")
+            return "RESPONSE_SUCCESS"
+        if "error" in body:
+            return "RESPONSE_ERROR"
         
         return "UNKNOWN_JSONRPC"
     
     def make_request(self, method: str, params: Dict[str, Any]) -> requests.Response:
-        payload = {
-            "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
-            "method": method,
-            "params": params
-        }
-        
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json, text/event-stream",
-        }
+        prefix = orjson.dumps({"jsonrpc": "2.0", "method": method, "params": params})[:-1]
+        return self._post(method, prefix)
+    
+    def _post(self, method: str, prefix: bytes) -> requests.Response:
+        body = prefix + b',"id":"req-%d"}' % next(self._ids)
         
-        if self.session_id:
-            headers["Mcp-Session-Id"] = self.session_id
+        # Content-Type/Accept ya van en la sesión
+        headers = {"Mcp-Session-Id": self.session_id} if self.session_id else None
         
         logging.info(f"\n🔵 Enviando: {method}")
         
         resp = self.session.post(
             f"{self.server_url}/mcp",
-            json=payload,
+            data=body,
             headers=headers,
             timeout=15
         )
@@ -181,96 +265,94 @@ class JSONRPCAnalyzer:
         
         return resp
     
+    def _flush(self):
+        if self._fh.closed:
+            return
+        self._fh.writelines(self._pending)
+        self._pending.clear()
+        self._fh.flush()
+        self._last_flush = time.monotonic()
+    
+    def close(self):
+        """Cierra el stream JSONL y escribe la captura completa una vez."""
+        if self._fh.closed:
+            return
+        self._flush()
+        self._fh.close()
+        self.save_capture()
+    
     def save_capture(self):
-        with open(self.capture_file, 'w', encoding='utf-8') as f:
-            json.dump({
+        with open(self.capture_file, 'wb') as f:
+            f.write(orjson.dumps({
                 "server_url": self.server_url,
                 "capture_time": datetime.now().isoformat(),
                 "total_messages": len(self.messages),
                 "messages": self.messages
-            }, f, indent=2, ensure_ascii=False)
+            }, option=orjson.OPT_INDENT_2, default=str))
     
     def run_test_scenario(self):
         print("\n" + "="*60)
         print("🔬 ESCENARIO DE PRUEBA JSONRPC")
         print("="*60)
         
-        scenarios = [
-            ("1. INICIALIZACIÓN", "initialize", {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {}
-            }),
-            ("2. LISTAR HERRAMIENTAS", "tools/list", {}),
-            ("3. LLAMAR ECHO", "tools/call", {
-                "name": "echo",
-                "arguments": {"texto": "Hola desde Wireshark analysis"}
-            }),
-            ("4. LLAMAR MORSE", "tools/call", {
-                "name": "morse",
-                "arguments": {"texto": "SOS"}
-            }),
-            ("5. LLAMAR DEMORSE", "tools/call", {
-                "name": "demorse",
-                "arguments": {"codigo": "... --- ..."}
-            }),
-        ]
+        # initialize primero; los pasos 2-5 son independientes y van en paralelo
+        (title, method, prefix), rest = self._PRESERIALIZED[0], self._PRESERIALIZED[1:]
+        self._print_step(title, *self._run_step(method, prefix))
         
-        for title, method, params in scenarios:
-            print(f"\n{title}")
-            print("-" * 40)
-            
-            try:
-                resp = self.make_request(method, params)
-                
-                if resp.status_code == 200:
-                    try:
-                        data = resp.json()
-                        if "result" in data:
-                            print(f"✅ Éxito: {json.dumps(data['result'], ensure_ascii=False)[:100]}")
-                        elif "error" in data:
-                            print(f"❌ Error: {data['error']}")
-                    except:
-                        print(f"✅ Respuesta: {resp.text[:100]}")
-                else:
-                    print(f"❌ HTTP {resp.status_code}")
-                    
-            except Exception as e:
-                print(f"❌ Excepción: {e}")
-            
-            time.sleep(0.5)  # Pausa para mejor visualización
+        with ThreadPoolExecutor(max_workers=len(rest)) as pool:
+            results = list(pool.map(lambda s: self._run_step(s[1], s[2]), rest))
+        for (title, _, _), (resp, error) in zip(rest, results):
+            self._print_step(title, resp, error)
+        
+        self._flush()
         
         print("\n" + "="*60)
         print("📊 RESUMEN DE CAPTURA")
         print("="*60)
         self.print_summary()
     
-    def print_summary(self):
-        message_types = {}
-        
-        for msg in self.messages:
-            msg_type = msg.get("jsonrpc_type", "UNKNOWN")
-            if msg_type not in message_types:
-                message_types[msg_type] = 0
-            message_types[msg_type] += 1
+    def _run_step(self, method: str, prefix: bytes):
+        try:
+            return self._post(method, prefix), None
+        except Exception as e:
+            return None, e
+    
+    def _print_step(self, title: str, resp, error):
+        print(f"\n{title}")
+        print("-" * 40)
         
+        if error is not None:
+            print(f"❌ Excepción: {error}")
+        elif resp.status_code == 200:
+            try:
+                data = resp.json()
+                if "result" in data:
+                    print(f"✅ Éxito: {orjson.dumps(data['result']).decode()[:100]}")
+                elif "error" in data:
+                    print(f"❌ Error: {data['error']}")
+            except:
+                print(f"✅ Respuesta: {resp.text[:100]}")
+        else:
+            print(f"❌ HTTP {resp.status_code}")
+    
+    def print_summary(self):
         print(f"\n📁 Archivo de captura: {self.capture_file}")
         print(f"📨 Total de mensajes: {len(self.messages)}")
-        print(f"📤 Peticiones: {len([m for m in self.messages if m['direction'] == 'REQUEST'])}")
-        print(f"📥 Respuestas: {len([m for m in self.messages if m['direction'] == 'RESPONSE'])}")
+        print(f"📤 Peticiones: {self.direction_counts['REQUEST']}")
+        print(f"📥 Respuestas: {self.direction_counts['RESPONSE']}")
         
         print("\n📊 Tipos de mensajes JSONRPC:")
-        for msg_type, count in sorted(message_types.items()):
+        for msg_type, count in sorted(self.type_counts.items()):
             icon = "🔄" if "SYNC" in msg_type else "📮" if "REQUEST" in msg_type else "📬"
             print(f"  {icon} {msg_type}: {count}")
         
         # Latencias
-        latencies = [m['latency_ms'] for m in self.messages 
-                    if m.get('direction') == 'RESPONSE' and 'latency_ms' in m]
-        if latencies:
+        responses = self.direction_counts["RESPONSE"]
+        if responses:
             print(f"\n⏱️ Latencias:")
-            print(f"  Min: {min(latencies):.2f}ms")
-            print(f"  Max: {max(latencies):.2f}ms")
-            print(f"  Avg: {sum(latencies)/len(latencies):.2f}ms")
+            print(f"  Min: {self.latency_min:.2f}ms")
+            print(f"  Max: {self.latency_max:.2f}ms")
+            print(f"  Avg: {self.latency_sum/responses:.2f}ms")
 
 def main():
     print("="*60)
@@ -282,14 +364,18 @@ def main():
     analyzer = JSONRPCAnalyzer(REMOTE_SERVER_URL)
     
     # Ejecutar escenario de prueba
-    analyzer.run_test_scenario()
+    try:
+        analyzer.run_test_scenario()
+    finally:
+        analyzer.close()
     
     print("\n" + "="*60)
     print("✅ ANÁLISIS COMPLETADO")
     print("="*60)
     print(f"\n📋 Archivos generados:")
     print(f"  1. {analyzer.capture_file} - Captura JSON completa")
-    print(f"  2. {LOG_DIR}/jsonrpc_debug.log - Log detallado")
+    print(f"  2. {analyzer.stream_file} - Mensajes en JSONL (uno por línea)")
+    print(f"  3. {LOG_DIR}/jsonrpc_debug.log - Log detallado")
     
     print("\n💡 Para analizar con Wireshark:")
     print("  1. Abre Wireshark")
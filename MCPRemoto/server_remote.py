@@ -1,4 +1,5 @@
 import os, json, unicodedata
+from functools import lru_cache
 from typing import Dict, List
 from mcp.server.fastmcp import FastMCP
 
@@ -15,20 +16,35 @@ MORSE_TABLE: Dict[str, str] = {
 }
 REV_MORSE = {v: k for k, v in MORSE_TABLE.items()}
 
+class _EncodeTable(dict):
+    # str.translate consulta con __getitem__: lo que no está en la tabla sale como "?"
+    def __missing__(self, cp):
+        return "? "
+
+_ENCODE_TABLE = _EncodeTable({ord(k): v + " " for k, v in MORSE_TABLE.items()})
+
+# Diacríticos combinantes U+0300–U+036F: casi todo lo que deja NFKD en texto latino
+_COMBINING_REMOVE = dict.fromkeys(range(0x0300, 0x0370))
+
+@lru_cache(maxsize=4096)
 def _strip_accents(s: str) -> str:
-    nfkd = unicodedata.normalize("NFKD", s)
+    if s.isascii():
+        return s
+    nfkd = unicodedata.normalize("NFKD", s).translate(_COMBINING_REMOVE)
+    if nfkd.isascii():
+        return nfkd
+    # Quedan caracteres no ASCII: filtrar el resto de combinantes uno a uno
     return "".join(c for c in nfkd if not unicodedata.combining(c))
 
 def _encode_morse(text: str) -> str:
     cleaned = _strip_accents(text).upper()
-    words = cleaned.split()
-    return " / ".join(" ".join(MORSE_TABLE.get(ch, "?") for ch in w) for w in words) if words else ""
+    return " / ".join(w.translate(_ENCODE_TABLE).rstrip() for w in cleaned.split())
 
+@lru_cache(maxsize=2048)
 def _decode_morse(code: str) -> str:
-    if not code.strip(): return ""
-    norm = code.replace("|", "/").strip()
-    words = [w.strip() for w in norm.split("/") if w.strip()]
-    return " ".join("".join(REV_MORSE.get(tok, "?") for tok in w.split()) for w in words)
+    # split() sin argumentos ya recorta; las palabras vacías se descartan
+    words = [w.split() for w in code.replace("|", "/").split("/")]
+    return " ".join(["".join([REV_MORSE.get(tok, "?") for tok in toks]) for toks in words if toks])
 
 @mcp.tool()
 def echo(texto: str) -> str:
@@ -53,18 +69,34 @@ def _health_payload():
 # --- ASGI apps ---
 mcp_asgi = mcp.streamable_http_app()   # EXPONE /mcp internamente. NO reescribas paths.
 
-async def _cors_send(send, ev):
-    if ev["type"] == "http.response.start":
-        headers = ev.setdefault("headers", [])
-        headers += [
-            (b"access-control-allow-origin", b"*"),
-            (b"access-control-allow-headers", b"*"),
-            (b"access-control-allow-methods", b"GET,POST,OPTIONS"),
-            # ¡Clave para el Inspector!
-            (b"access-control-expose-headers", b"Mcp-Session-Id"),
-            (b"cache-control", b"no-store"),
-        ]
-    await send(ev)
+_CORS_HEADERS = (
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-allow-methods", b"GET,POST,OPTIONS"),
+    # ¡Clave para el Inspector!
+    (b"access-control-expose-headers", b"Mcp-Session-Id"),
+    (b"cache-control", b"no-store"),
+)
+
+class _CorsSendWrap:
+    # Envuelve el send de /mcp para añadir CORS al inicio de la respuesta
+    __slots__ = ("_send",)
+
+    def __init__(self, send):
+        self._send = send
+
+    async def __call__(self, ev):
+        if ev["type"] == "http.response.start":
+            ev["headers"] = [*ev.get("headers", ()), *_CORS_HEADERS]
+        await self._send(ev)
+
+# La respuesta de health es estática: cuerpo y cabeceras se arman una vez
+_HEALTH_BODY = json.dumps(_health_payload()).encode("utf-8")
+_HEALTH_HEADERS = (
+    (b"content-type", b"application/json; charset=utf-8"),
+    (b"content-length", str(len(_HEALTH_BODY)).encode()),
+    *_CORS_HEADERS,
+)
 
 async def app(scope, receive, send):
     if scope["type"] != "http":
@@ -75,23 +107,18 @@ async def app(scope, receive, send):
 
     # Preflight CORS para /mcp
     if method == "OPTIONS" and (path == "/mcp" or path.startswith("/mcp")):
-        await _cors_send(send, {"type":"http.response.start","status":204,"headers":[]})
+        await send({"type":"http.response.start","status":204,"headers":_CORS_HEADERS})
         await send({"type":"http.response.body","body":b""})
         return
 
     # Health sencillo en "/"
     if method in ("GET","HEAD") and path == "/":
-        body = json.dumps(_health_payload()).encode("utf-8")
-        await _cors_send(send, {"type":"http.response.start","status":200,
-                                "headers":[(b"content-type", b"application/json; charset=utf-8")]})
-        if method == "GET":
-            await send({"type":"http.response.body","body": body})
-        else:
-            await send({"type":"http.response.body","body": b""})
+        await send({"type":"http.response.start","status":200,"headers":_HEALTH_HEADERS})
+        await send({"type":"http.response.body","body": _HEALTH_BODY if method == "GET" else b""})
         return
 
     # TODO: NO reescribas /mcp -> /  (deja que mcp_asgi maneje /mcp)
-    return await mcp_asgi(scope, receive, lambda ev: _cors_send(send, ev))
+    return await mcp_asgi(scope, receive, _CorsSendWrap(send))
 
 if __name__ == "__main__":
     import uvicorn